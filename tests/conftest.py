@@ -0,0 +1,10 @@
+import os
+
+from hypothesis import settings
+
+# "ci" is used by default, "fast" and "full" can be selected using
+# the environment variable HYP_PROFILE
+settings.register_profile("ci", max_examples=50, deadline=None)
+settings.register_profile("fast", max_examples=20, deadline=None, derandomize=True)
+settings.register_profile("full", max_examples=200, deadline=None)
+settings.load_profile(os.environ.get("HYP_PROFILE", "ci"))
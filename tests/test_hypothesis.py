@@ -1,5 +1,7 @@
+from array import array
 from itertools import product
-from functools import partial
+from math import isclose
+from functools import partial, lru_cache
 from string import ascii_letters, digits, punctuation
 
 from hypothesis import given, assume, settings
@@ -8,13 +10,9 @@ import pytest
 
 from rapidfuzz import fuzz, process, utils, string_metric
 from rapidfuzz.distance import Levenshtein, Indel
-import random
 import numpy as np
 
-def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
-    return abs(a-b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
-
-def levenshtein(s1, s2, weights=(1, 1, 1)):
+def _levenshtein_py(s1, s2, weights=(1, 1, 1)):
     """
     python implementation of a generic Levenshtein distance
     this is much less error prone, than the bitparallel C implementations
@@ -23,49 +21,66 @@ def levenshtein(s1, s2, weights=(1, 1, 1)):
     """
 
     rows = len(s1)+1
-    cols = len(s2)+1
     insert, delete, substitute = weights
 
-    dist = [[0 for x in range(cols)] for x in range(rows)]
-
-    for row in range(1, rows):
-        dist[row][0] = row * delete
+    # only the previous column of the matrix is required
+    prev = array('i', [row * delete for row in range(rows)])
+    curr = array('i', prev)
 
-    for col in range(1, cols):
-        dist[0][col] = col * insert
-
-    for col in range(1, cols):
+    for col in range(1, len(s2)+1):
+        ch2 = s2[col-1]
+        curr[0] = col * insert
         for row in range(1, rows):
-            if s1[row-1] == s2[col-1]:
-                cost = 0
-            else:
-                cost = substitute
+            d1 = curr[row-1] + delete  # deletion
+            d2 = prev[row] + insert    # insertion
+            d3 = prev[row-1]           # substitution
+            if s1[row-1] != ch2:
+                d3 += substitute
 
-            dist[row][col] = min(
-                dist[row-1][col] + delete,  # deletion
-                dist[row][col-1] + insert,  # insertion
-                dist[row-1][col-1] + cost    # substitution
-            )
+            d1 = d1 if d1 < d2 else d2
+            curr[row] = d3 if d3 < d1 else d1
 
-    return dist[-1][-1]
+        prev, curr = curr, prev
 
-def normalize_distance(dist, s1, s2, weights=(1, 1, 1)):
+    return prev[-1]
+
+@lru_cache(maxsize=4096)
+def levenshtein(s1, s2, weights=(1, 1, 1)):
+    """
+    reference implementation of a generic Levenshtein distance
+    used to test the C implementation
+    """
     insert, delete, substitute = weights
+    if not s1:
+        return len(s2) * insert
+    if not s2:
+        return len(s1) * delete
+
+    # the memory usage grows with the length of s1,
+    # so s1 is always the shorter string
     if len(s1) > len(s2):
-        max_dist = min([
-            # delete all characters from s1 and insert all characters from s2
-            len(s1) * delete + len(s2) * insert,
-            # replace all characters and delete the remaining characters from s1
-            len(s2) * substitute + (len(s1) - len(s2)) * delete
-        ])
-    else:
-        max_dist = min([
-            # delete all characters from s1 and insert all characters from s2
-            len(s1) * delete + len(s2) * insert,
-            # replace all characters and insert the remaining characters into s1
-            len(s1) * substitute + (len(s2) - len(s1)) * insert
-        ])
+        s1, s2 = s2, s1
+        insert, delete = delete, insert
+        weights = (insert, delete, substitute)
+
+    return _levenshtein_py(s1, s2, weights)
+
+@lru_cache(maxsize=None)
+def _max_dist(len1, len2, weights):
+    """
+    maximum Levenshtein distance, which only depends on the string lengths
+    """
+    insert, delete, substitute = weights
+    return min(
+        # delete all characters from s1 and insert all characters from s2
+        len1 * delete + len2 * insert,
+        # replace all characters and delete the remaining characters from s1
+        # or insert the remaining characters into s1
+        min(len1, len2) * substitute + abs(len1 - len2) * (delete if len1 > len2 else insert)
+    )
 
+def normalize_distance(dist, s1, s2, weights=(1, 1, 1)):
+    max_dist = _max_dist(len(s1), len(s2), weights)
     return 100 - 100 * float(dist) / float(max_dist) if max_dist else 100
 
 def partial_ratio_short_needle(s1, s2):
@@ -78,63 +93,70 @@ def partial_ratio_short_needle(s1, s2):
     if len(s1) > len(s2):
         return partial_ratio_short_needle(s2, s1)
     parts = [s2[max(0, i) : min(len(s2), i+len(s1))] for i in range(-len(s1), len(s2))]
-    res = 0
-    for part in parts:
-        res = max(res, fuzz.ratio(s1, part))
-    return res
+    return float(process.cdist([s1], parts, scorer=fuzz.ratio, dtype=np.float64).max())
 
 def cdist_scorer(queries, choices, scorer):
-    matrix = np.zeros((len(queries), len(choices)), dtype=np.uint8)
-
-    for i, query in enumerate(queries):
-        for j, choice in enumerate(choices):
-            matrix[i, j] = scorer(query, choice)
-
-    return matrix
+    return np.fromiter(
+        (scorer(query, choice) for query in queries for choice in choices),
+        dtype=np.uint8, count=len(queries) * len(choices)
+    ).reshape(len(queries), len(choices))
 
 def cdist_distance(queries, choices, scorer):
-    matrix = np.zeros((len(queries), len(choices)), dtype=np.int32)
-
-    for i, query in enumerate(queries):
-        for j, choice in enumerate(choices):
-            matrix[i, j] = scorer(query, choice)
-
-    return matrix
+    return np.fromiter(
+        (scorer(query, choice) for query in queries for choice in choices),
+        dtype=np.int32, count=len(queries) * len(choices)
+    ).reshape(len(queries), len(choices))
 
 def extractOne_scorer(s1, s2, scorer, processor=None, **kwargs):
     return process.extractOne(s1, [s2], processor=processor, scorer=scorer, **kwargs)[1]
 
-def extract_scorer(s1, s2, scorer, processor=None, **kwargs):
-    return process.extract(s1, [s2], processor=processor, scorer=scorer, **kwargs)[0][1]
-
-def extract_iter_scorer(s1, s2, scorer, processor=None, **kwargs):
-    return list(process.extract_iter(s1, [s2], processor=processor, scorer=scorer, **kwargs))[0][1]
+def cdist_single_scorer(s1, s2, scorer, processor=None, **kwargs):
+    return process.cdist([s1], [s2], processor=processor, scorer=scorer, **kwargs)[0, 0]
 
 def apply_editops(s1, s2, ops):
-    new_str = ''
+    buf = [None] * (len(s1) + len(s2))
+    k = 0
     s1_pos = 0
     for op in ops:
         j = op[1] - s1_pos
         while j:
-            new_str += s1[s1_pos]
+            buf[k] = s1[s1_pos]
+            k += 1
             s1_pos += 1
             j -= 1
 
         if op[0] == 'delete':
             s1_pos += 1
         elif op[0] == 'insert':
-            new_str += s2[op[2]]
+            buf[k] = s2[op[2]]
+            k += 1
         elif op[0] == 'replace':
-            new_str += s2[op[2]]
+            buf[k] = s2[op[2]]
+            k += 1
             s1_pos += 1
 
     j = len(s1) - s1_pos
     while j:
-        new_str += s1[s1_pos]
+        buf[k] = s1[s1_pos]
+        k += 1
         s1_pos += 1
         j -= 1
 
-    return new_str
+    return ''.join(buf[:k])
+
+def _check_levenshtein(s1, s2, weights):
+    """
+    compare the results of all APIs calculating the Levenshtein distance
+    with the reference implementation
+    """
+    # distance
+    reference_dist = levenshtein(s1, s2, weights)
+    assert string_metric.levenshtein(s1, s2, weights=weights) == reference_dist
+    assert cdist_single_scorer(s1, s2, string_metric.levenshtein, weights=weights) == reference_dist
+    # normalized distance
+    reference_sim = normalize_distance(reference_dist, s1, s2, weights)
+    assert isclose(string_metric.normalized_levenshtein(s1, s2, weights=weights), reference_sim)
+    assert isclose(cdist_single_scorer(s1, s2, string_metric.normalized_levenshtein, weights=weights, dtype=np.float64), reference_sim)
 
 
 HYPOTHESIS_ALPHABET = ascii_letters + digits + punctuation
@@ -164,7 +186,7 @@ PROCESSORS = [
 ]
 
 @given(s1=st.text(), s2=st.text())
-@settings(max_examples=100, deadline=None)
+@settings(max_examples=100)
 def test_levenshtein_editops(s1, s2):
     """
     test Levenshtein.editops with any sizes
@@ -173,7 +195,6 @@ def test_levenshtein_editops(s1, s2):
     assert apply_editops(s1, s2, ops) == s2
 
 @given(s1=st.text(min_size=65), s2=st.text(min_size=65))
-@settings(max_examples=50, deadline=None)
 def test_levenshtein_editops_block(s1, s2):
     """
     test Levenshtein.editops for long strings
@@ -182,7 +203,7 @@ def test_levenshtein_editops_block(s1, s2):
     assert apply_editops(s1, s2, ops) == s2
 
 @given(s1=st.text(), s2=st.text())
-@settings(max_examples=100, deadline=None)
+@settings(max_examples=100)
 def test_indel_editops(s1, s2):
     """
     test Indel.editops with any sizes
@@ -191,7 +212,6 @@ def test_indel_editops(s1, s2):
     assert apply_editops(s1, s2, ops) == s2
 
 @given(s1=st.text(min_size=65), s2=st.text(min_size=65))
-@settings(max_examples=50, deadline=None)
 def test_indel_editops_block(s1, s2):
     """
     test Indel.editops for long strings
@@ -200,7 +220,7 @@ def test_indel_editops_block(s1, s2):
     assert apply_editops(s1, s2, ops) == s2
 
 @given(s1=st.text(max_size=64), s2=st.text())
-@settings(max_examples=50, deadline=1000)
+@settings(deadline=1000)
 def test_partial_ratio_short_needle(s1, s2):
     """
     test partial_ratio for short needles (needle <= 64)
@@ -208,7 +228,7 @@ def test_partial_ratio_short_needle(s1, s2):
     assert isclose(fuzz.partial_ratio(s1, s2), partial_ratio_short_needle(s1, s2))
 
 @given(s1=st.text(), s2=st.text())
-@settings(max_examples=50, deadline=1000)
+@settings(deadline=1000)
 def test_token_ratio(s1, s2):
     """
     token_ratio should be max(token_sort_ratio, token_set_ratio)
@@ -216,7 +236,7 @@ def test_token_ratio(s1, s2):
     assert fuzz.token_ratio(s1, s2) == max(fuzz.token_sort_ratio(s1, s2), fuzz.token_set_ratio(s1, s2))
 
 @given(s1=st.text(), s2=st.text())
-@settings(max_examples=50, deadline=1000)
+@settings(deadline=1000)
 def test_partial_token_ratio(s1, s2):
     """
     partial_token_ratio should be max(partial_token_sort_ratio, partial_token_set_ratio)
@@ -225,133 +245,90 @@ def test_partial_token_ratio(s1, s2):
 
 
 @given(s1=st.text(max_size=64), s2=st.text(max_size=64))
-@settings(max_examples=50, deadline=None)
 def test_levenshtein_word(s1, s2):
     """
     Test short Levenshtein implementation against simple implementation
     """
-    # uniform Levenshtein
-    # distance
-    reference_dist = levenshtein(s1, s2)
-    assert string_metric.levenshtein(s1, s2) == reference_dist
-    assert extractOne_scorer(  s1, s2, string_metric.levenshtein) == reference_dist
-    assert extract_scorer(     s1, s2, string_metric.levenshtein) == reference_dist
-    assert extract_iter_scorer(s1, s2, string_metric.levenshtein) == reference_dist
-    # normalized distance
-    reference_sim = normalize_distance(reference_dist, s1, s2)
-    assert isclose(string_metric.normalized_levenshtein(s1, s2), reference_sim)
-    assert isclose(extractOne_scorer(  s1, s2, string_metric.normalized_levenshtein), reference_sim)
-    assert isclose(extract_scorer(     s1, s2, string_metric.normalized_levenshtein), reference_sim)
-    assert isclose(extract_iter_scorer(s1, s2, string_metric.normalized_levenshtein), reference_sim)
+    # empty strings are covered by test_levenshtein_empty
+    assume(s1 and s2)
 
+    # uniform Levenshtein
+    _check_levenshtein(s1, s2, (1, 1, 1))
     # InDel-Distance
-    # distance
-    reference_dist = levenshtein(s1, s2, weights=(1,1,2))
-    assert string_metric.levenshtein(s1, s2, weights=(1,1,2)) == reference_dist
-    assert extractOne_scorer(  s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    assert extract_scorer(     s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    assert extract_iter_scorer(s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    # normalized distance
-    reference_sim = normalize_distance(reference_dist, s1, s2, weights=(1,1,2))
-    assert isclose(string_metric.normalized_levenshtein(s1, s2, weights=(1,1,2)), reference_sim)
-    assert isclose(extractOne_scorer(  s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
-    assert isclose(extract_scorer(     s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
-    assert isclose(extract_iter_scorer(s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
+    _check_levenshtein(s1, s2, (1, 1, 2))
+
+
+@given(s=st.text())
+def test_levenshtein_empty(s):
+    """
+    Test Levenshtein implementation when one of the strings is empty
+    """
+    for weights in [(1, 1, 1), (1, 1, 2)]:
+        insert, delete, _ = weights
+        reference_sim = 0 if s else 100
+        assert string_metric.levenshtein("", s, weights=weights) == len(s) * insert
+        assert string_metric.levenshtein(s, "", weights=weights) == len(s) * delete
+        assert extractOne_scorer("", s, string_metric.levenshtein, weights=weights) == len(s) * insert
+        assert extractOne_scorer(s, "", string_metric.levenshtein, weights=weights) == len(s) * delete
+        assert cdist_single_scorer("", s, string_metric.levenshtein, weights=weights) == len(s) * insert
+        assert cdist_single_scorer(s, "", string_metric.levenshtein, weights=weights) == len(s) * delete
+        assert isclose(string_metric.normalized_levenshtein("", s, weights=weights), reference_sim)
+        assert isclose(string_metric.normalized_levenshtein(s, "", weights=weights), reference_sim)
+        assert isclose(cdist_single_scorer("", s, string_metric.normalized_levenshtein,
+            weights=weights, dtype=np.float64), reference_sim)
+        assert isclose(cdist_single_scorer(s, "", string_metric.normalized_levenshtein,
+            weights=weights, dtype=np.float64), reference_sim)
 
 
 @given(s1=st.text(min_size=65), s2=st.text(min_size=65))
-@settings(max_examples=50, deadline=None)
 def test_levenshtein_block(s1, s2):
     """
     Test blockwise Levenshtein implementation against simple implementation
     """
     # uniform Levenshtein
-    # distance
-    reference_dist = levenshtein(s1, s2)
-    assert string_metric.levenshtein(s1, s2) == reference_dist
-    assert extractOne_scorer(  s1, s2, string_metric.levenshtein) == reference_dist
-    assert extract_scorer(     s1, s2, string_metric.levenshtein) == reference_dist
-    assert extract_iter_scorer(s1, s2, string_metric.levenshtein) == reference_dist
-    # normalized distance
-    reference_sim = normalize_distance(reference_dist, s1, s2)
-    assert isclose(string_metric.normalized_levenshtein(s1, s2), reference_sim)
-    assert isclose(extractOne_scorer(  s1, s2, string_metric.normalized_levenshtein), reference_sim)
-    assert isclose(extract_scorer(     s1, s2, string_metric.normalized_levenshtein), reference_sim)
-    assert isclose(extract_iter_scorer(s1, s2, string_metric.normalized_levenshtein), reference_sim)
-
+    _check_levenshtein(s1, s2, (1, 1, 1))
     # InDel-Distance
-    # distance
-    reference_dist = levenshtein(s1, s2, weights=(1,1,2))
-    assert string_metric.levenshtein(s1, s2, weights=(1,1,2)) == reference_dist
-    assert extractOne_scorer(  s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    assert extract_scorer(     s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    assert extract_iter_scorer(s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    # normalized distance
-    reference_sim = normalize_distance(reference_dist, s1, s2, weights=(1,1,2))
-    assert isclose(string_metric.normalized_levenshtein(s1, s2, weights=(1,1,2)), reference_sim)
-    assert isclose(extractOne_scorer(  s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
-    assert isclose(extract_scorer(     s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
-    assert isclose(extract_iter_scorer(s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
+    _check_levenshtein(s1, s2, (1, 1, 2))
 
 @given(s1=st.text(), s2=st.text())
-@settings(max_examples=50, deadline=None)
 def test_levenshtein_random(s1, s2):
     """
     Test mixed strings to test through all implementations of Levenshtein
     """
-    # uniform Levenshtein
-    # distance
-    reference_dist = levenshtein(s1, s2)
-    assert string_metric.levenshtein(s1, s2) == reference_dist
-    assert extractOne_scorer(  s1, s2, string_metric.levenshtein) == reference_dist
-    assert extract_scorer(     s1, s2, string_metric.levenshtein) == reference_dist
-    assert extract_iter_scorer(s1, s2, string_metric.levenshtein) == reference_dist
-    # normalized distance
-    reference_sim = normalize_distance(reference_dist, s1, s2)
-    assert isclose(string_metric.normalized_levenshtein(s1, s2), reference_sim)
-    assert isclose(extractOne_scorer(  s1, s2, string_metric.normalized_levenshtein), reference_sim)
-    assert isclose(extract_scorer(     s1, s2, string_metric.normalized_levenshtein), reference_sim)
-    assert isclose(extract_iter_scorer(s1, s2, string_metric.normalized_levenshtein), reference_sim)
+    # empty strings are covered by test_levenshtein_empty
+    assume(s1 and s2)
 
+    # uniform Levenshtein
+    _check_levenshtein(s1, s2, (1, 1, 1))
     # InDel-Distance
-    # distance
-    reference_dist = levenshtein(s1, s2, weights=(1,1,2))
-    assert string_metric.levenshtein(s1, s2, weights=(1,1,2)) == reference_dist
-    assert extractOne_scorer(  s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    assert extract_scorer(     s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    assert extract_iter_scorer(s1, s2, string_metric.levenshtein, weights=(1,1,2)) == reference_dist
-    # normalized distance
-    reference_sim = normalize_distance(reference_dist, s1, s2, weights=(1,1,2))
-    assert isclose(string_metric.normalized_levenshtein(s1, s2, weights=(1,1,2)), reference_sim)
-    assert isclose(extractOne_scorer(  s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
-    assert isclose(extract_scorer(     s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
-    assert isclose(extract_iter_scorer(s1, s2, string_metric.normalized_levenshtein, weights=(1,1,2)), reference_sim)
+    _check_levenshtein(s1, s2, (1, 1, 2))
 
 @given(sentence=st.text())
-@settings(max_examples=50, deadline=1000)
+@settings(deadline=1000)
 def test_multiple_processor_runs(sentence):
     """
     Test that running a preprocessor on a sentence
     a second time does not change the result
     """
-    assert utils.default_process(sentence) \
-        == utils.default_process(utils.default_process(sentence))
+    processed = utils.default_process(sentence)
+    assert processed == utils.default_process(processed)
 
 
 @pytest.mark.parametrize('scorer,processor', list(product(FULL_SCORERS, PROCESSORS)))
-@given(choices=st.lists(st.text(), min_size=1))
-@settings(max_examples=50, deadline=1000)
-def test_only_identical_strings_extracted(scorer, processor, choices):
+@given(choices=st.lists(st.text(), min_size=1), data=st.data())
+@settings(deadline=1000)
+def test_only_identical_strings_extracted(scorer, processor, choices, data):
     """
     Test that only identical (post processing) strings score 100 on the test.
     If two strings are not identical then using full comparison methods they should
     not be a perfect (100) match.
     :param scorer:
     :param processor:
+    :param choices:
     :param data:
     :return:
     """
-    query = random.choice(choices)
+    query = data.draw(st.sampled_from(choices))
     assume(processor(query) != '')
 
     matches = process.extract(query, choices,
@@ -360,12 +337,13 @@ def test_only_identical_strings_extracted(scorer, processor, choices):
 
     assert matches != []
 
+    processed_query = processor(query)
     for match in matches:
-        assert processor(query) == processor(match[0])
+        assert processed_query == processor(match[0])
 
 
 @given(queries=st.lists(st.text(), min_size=1), choices=st.lists(st.text(), min_size=1))
-@settings(max_examples=50, deadline=1000)
+@settings(deadline=1000)
 def test_cdist(queries, choices):
     """
     Test that cdist returns correct results
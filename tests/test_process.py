@@ -5,6 +5,7 @@ import unittest
 import pytest
 
 from rapidfuzz import process, fuzz, utils
+from rapidfuzz.distance import Levenshtein
 import pandas as pd
 
 class ProcessTest(unittest.TestCase):
@@ -253,5 +254,19 @@ def test_extractOne_case_sensitive(processor, scorer):
 def test_extractOne_use_first_match(scorer):
     assert process.extractOne("new york mets", ["new york mets", "new york mets"], scorer=scorer)[2] == 0
 
+@pytest.mark.parametrize("weights", [(1, 1, 1), (1, 1, 2)])
+@pytest.mark.parametrize("s1,s2", [("", "test"), ("kitten", "sitting"), ("a" * 65, "b" + "a" * 70)])
+def test_extract_levenshtein(s1, s2, weights):
+    """
+    extractOne, extract and extract_iter should return the same Levenshtein
+    distance as the scorer
+    """
+    dist = Levenshtein.distance(s1, s2, weights=weights)
+    sim = Levenshtein.normalized_similarity(s1, s2, weights=weights)
+    for scorer, score in [(Levenshtein.distance, dist), (Levenshtein.normalized_similarity, sim)]:
+        assert process.extractOne(s1, [s2], scorer=scorer, weights=weights)[1] == pytest.approx(score)
+        assert process.extract(s1, [s2], scorer=scorer, weights=weights)[0][1] == pytest.approx(score)
+        assert list(process.extract_iter(s1, [s2], scorer=scorer, weights=weights))[0][1] == pytest.approx(score)
+
 if __name__ == '__main__':
     unittest.main()